@@ -1,6 +1,12 @@
+from __future__ import annotations
+
+import numpy as np
 import xarray as xr
 from loguru import logger
 import os
+import threading
+from concurrent.futures import Future
+from pathlib import Path
 
 os.environ["UDA_HOST"] = os.environ.get("UDA_HOST", "uda2.mast.l")
 os.environ["UDA_META_PLUGINNAME"] = os.environ.get("UDA_META_PLUGINNAME", "MASTU_DB")
@@ -11,44 +17,116 @@ os.environ["UDA_METANEW_PLUGINNAME"] = os.environ.get(
 from pyuda import Client
 
 
+WAVELENGTH_SIGNAL = "/act/cel3/ss/wavelength"
+
+
 class UDALoader:
-    def __init__(self):
-        self.client = Client()
+    def __init__(self, cache_dir: Path | None = None):
+        # Signals are fetched from many executor threads at once, and a pyuda
+        # client is not safe to share between them, so each thread gets its own
+        self._local = threading.local()
+        # When set, every fetched signal is kept on disk so later runs skip UDA
+        self.cache_dir = cache_dir
+        # Every volume signal in a shot shares one wavelength axis, and they are
+        # usually fetched concurrently, so the first caller fetches it and the
+        # rest wait on the same future
+        self._wavelengths: dict[int, Future] = {}
+        self._wavelengths_lock = threading.Lock()
+
+    @property
+    def client(self) -> Client:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = Client()
+        return client
+
+    def get_wavelength(self, shot_id: int) -> np.ndarray:
+        with self._wavelengths_lock:
+            future = self._wavelengths.get(shot_id)
+            is_owner = future is None
+            if is_owner:
+                future = self._wavelengths[shot_id] = Future()
+
+        if is_owner:
+            try:
+                wavelength = self.client.get(WAVELENGTH_SIGNAL, shot_id)
+                future.set_result(wavelength.data[0])
+            except Exception as error:
+                with self._wavelengths_lock:
+                    self._wavelengths.pop(shot_id, None)
+                future.set_exception(error)
+        return future.result()
+
+    def release_wavelength(self, shot_id: int):
+        # Drop a shot's wavelength axis once its volume signals have been fetched,
+        # so the loader doesn't hold one for every shot in the run
+        with self._wavelengths_lock:
+            self._wavelengths.pop(shot_id, None)
+
+    def _cached(self, name: str, shot_id: int, fetch) -> xr.Dataset:
+        if self.cache_dir is None:
+            return fetch()
+
+        path = Path(self.cache_dir) / str(shot_id) / f"{name}.zarr"
+        if not path.exists():
+            # Write beside the final path and rename, so an interrupted run never
+            # leaves a partial store that looks complete
+            partial = path.with_name(f"{path.name}.partial")
+            fetch().to_zarr(partial, mode="w")
+            partial.rename(path)
+
+        # Callers read every value (often more than once), so load it all now
+        # rather than going back to the store on each access
+        return xr.open_zarr(path, chunks=None).load()
 
     def get_radial_profile(
         self, name: str, signal_name: str, shot_id: int
+    ) -> xr.Dataset:
+        return self._cached(
+            name, shot_id, lambda: self._get_radial_profile(name, signal_name, shot_id)
+        )
+
+    def get_volume_data(self, name: str, signal_name: str, shot_id: int) -> xr.Dataset:
+        return self._cached(
+            name, shot_id, lambda: self._get_volume_data(name, signal_name, shot_id)
+        )
+
+    def _get_radial_profile(
+        self, name: str, signal_name: str, shot_id: int
     ) -> xr.Dataset:
         logger.info(f"Loading {name} for shot {shot_id}")
         signal = self.client.get(signal_name, shot_id)
         data = xr.DataArray(
-            signal.data,
+            signal.data.astype(np.float32, copy=False),
             dims=("time", "major_radius"),
             coords={"time": signal.dims[0].data, "major_radius": signal.dims[1].data},
             name=name,
         )
         error = xr.DataArray(
-            signal.errors, dims=("time", "major_radius"), coords=data.coords
+            signal.errors.astype(np.float32, copy=False),
+            dims=("time", "major_radius"),
+            coords=data.coords,
         )
         ds = xr.Dataset({f"{name}_data": data, f"{name}_error": error})
         return ds
 
-    def get_volume_data(self, name: str, signal_name: str, shot_id: int) -> xr.Dataset:
+    def _get_volume_data(self, name: str, signal_name: str, shot_id: int) -> xr.Dataset:
         logger.info(f"Loading {name} for shot {shot_id}")
         signal = self.client.get(signal_name, shot_id)
-        wavelength = self.client.get("/act/cel3/ss/wavelength", shot_id)
+        wavelength = self.get_wavelength(shot_id)
 
         data = xr.DataArray(
-            signal.data,
+            signal.data.astype(np.float32, copy=False),
             dims=("time", "major_radius", "wavelength"),
             coords={
                 "time": signal.dims[0].data,
                 "major_radius": signal.dims[1].data,
-                "wavelength": wavelength.data[0],
+                "wavelength": wavelength,
             },
             name=name,
         )
         error = xr.DataArray(
-            signal.errors,
+            signal.errors.astype(np.float32, copy=False),
             dims=("time", "major_radius", "wavelength"),
             coords=data.coords,
         )
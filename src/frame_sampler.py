@@ -1,100 +1,237 @@
+from __future__ import annotations
+
 from pathlib import Path
 import xarray as xr
 import numpy as np
 import argparse
+import asyncio
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Iterable
 from loguru import logger
+import zarr
 from src.data import UDALoader
 
+_LOADER: UDALoader | None = None
+_LOADER_LOCK = threading.Lock()
+
+
+def get_loader(cache_dir: Path | None = None) -> UDALoader:
+    """Return the process-wide UDALoader, creating it on first use.
 
-def subsample_dataset(dataset: xr.Dataset, method: str, num_samples: int) -> xr.Dataset:
-    time = dataset.ss_counts_data.dropna(dim="time", how="all").time.values
+    A `cache_dir` of None reuses whatever loader already exists; asking for a
+    different cache directory than the existing loader's is an error.
+    """
+    global _LOADER
+    with _LOADER_LOCK:
+        if _LOADER is None:
+            _LOADER = UDALoader(cache_dir=cache_dir)
+        elif cache_dir is not None and _LOADER.cache_dir != cache_dir:
+            raise ValueError(
+                f"UDALoader already uses cache dir {_LOADER.cache_dir}, not {cache_dir}"
+            )
+        return _LOADER
+
+
+def subsample_dataset(
+    dataset: xr.Dataset, method: str, num_samples: int, seed: int | None = None
+) -> xr.Dataset:
+    counts = dataset.ss_counts_data
+    has_data = counts.notnull().any([dim for dim in counts.dims if dim != "time"])
+    valid = np.flatnonzero(has_data.values)
+    num_samples = min(num_samples, len(valid))
 
     if method == "random":
-        sampled_times = np.random.choice(time, size=num_samples, replace=False)
+        rng = np.random.default_rng(seed)
+        index = np.sort(rng.choice(len(valid), size=num_samples, replace=False))
     elif method == "grid":
-        sampled_times = time[:: max(1, len(time) // num_samples)]
+        index = np.linspace(0, len(valid) - 1, num_samples).astype(np.int64)
     else:
         raise ValueError(f"Unknown sampling method: {method}")
 
-    return dataset.sel(time=sampled_times)
+    return dataset.isel(time=valid[index])
+
+
+def interpolate_time(
+    profiles: list[xr.Dataset], time_base: np.ndarray
+) -> list[xr.Dataset]:
+    """Linearly interpolate every variable in each profile onto a new time base.
+
+    Equivalent to `profile.interp(time=time_base)` for a sorted time axis (points
+    outside the source range become NaN), but applied to the raw arrays directly.
+    Signals from the same diagnostic share a time axis, so the interpolation indices
+    and weights are computed once per distinct axis rather than once per profile.
+    """
+    groups = {}
+    for i, profile in enumerate(profiles):
+        groups.setdefault(profile.time.values.tobytes(), []).append(i)
+
+    interpolated = [None] * len(profiles)
+    for indices in groups.values():
+        group = [profiles[i] for i in indices]
+
+        # Trim leading/trailing frames with no data at all so they aren't interpolated.
+        # Interior gaps are kept so they still come out as NaN rather than being bridged.
+        has_data = np.zeros(group[0].sizes["time"], dtype=bool)
+        for profile in group:
+            for var in profile.data_vars.values():
+                values = var.values
+                has_data |= ~np.isnan(values).all(axis=tuple(range(1, values.ndim)))
+        valid = np.flatnonzero(has_data)
+        if len(valid) > 1:
+            window = slice(valid[0], valid[-1] + 1)
+            group = [profile.isel(time=window) for profile in group]
+
+        time = group[0].time.values
+        upper = np.clip(np.searchsorted(time, time_base), 1, len(time) - 1)
+        lower = upper - 1
+        weight = (time_base - time[lower]) / (time[upper] - time[lower])
+        out_of_range = (time_base < time[0]) | (time_base > time[-1])
+
+        for i, profile in zip(indices, group):
+            variables = {}
+            for name, var in profile.data_vars.items():
+                values = var.values
+                w = weight.reshape(-1, *([1] * (values.ndim - 1)))
+                # lo + (hi - lo) * w, updated in place to avoid full-size temporaries
+                start = values[lower]
+                result = values[upper]
+                result -= start
+                result *= w
+                result += start
+                result[out_of_range] = np.nan
+                variables[name] = (var.dims, result)
+            coords = {**profile.coords, "time": time_base}
+            interpolated[i] = xr.Dataset(variables, coords=coords)
+
+    return interpolated
+
+
+RADIAL_SIGNALS = {
+    "fit_ratio": "ACT/CEL3/SS/PVB/FIT_RATIO",
+    "emissivity": "ACT/CEL3/SS/PVB/C5291/EMISSIVITY",
+    "velocity": "ACT/CEL3/SS/PVB/C5291/VELOCITY",
+    "temperature": "ACT/CEL3/SS/PVB/C5291/TEMPERATURE",
+}
+
+VOLUME_SIGNALS = {
+    "ss_fits": "ACT/CEL3/SS/PVB/SS_FITS",
+    "ss_counts": "ACT/CEL3/SS/COUNTS",
+    "ss_bg_counts": "ACT/CEL3/SS/PVB/SCALED_BG_COUNTS",
+    "ss_sub_fits": "ACT/CEL3/SS/PVB/SUB_FITS",
+    "ss_sub_counts": "ACT/CEL3/SS/PVB/SUB_COUNTS",
+}
 
+# zarr 3 takes its own codec classes under "compressors"; zarr 2 (still resolved
+# on Python < 3.11) takes a numcodecs compressor under "compressor"
+if int(zarr.__version__.split(".")[0]) >= 3:
+    from zarr.codecs import BloscCodec
 
-def load_dataset(
-    shot_id: int, sample_method: str = "grid", num_samples: int = 10
+    COMPRESSION = {
+        "compressors": BloscCodec(cname="zstd", clevel=3, shuffle="bitshuffle")
+    }
+else:
+    from numcodecs import Blosc
+
+    COMPRESSION = {
+        "compressor": Blosc(cname="zstd", clevel=3, shuffle=Blosc.BITSHUFFLE)
+    }
+
+
+async def load_dataset(
+    shot_id: int,
+    sample_method: str = "grid",
+    num_samples: int = 10,
+    loader: UDALoader | None = None,
+    uda_executor: Executor | None = None,
+    executor: Executor | None = None,
 ) -> xr.Dataset:
-    loader = UDALoader()
+    if loader is None:
+        loader = get_loader()
 
-    ## SS Profiles
-    ss_fit_ratio = loader.get_radial_profile(
-        name="fit_ratio",
-        signal_name="ACT/CEL3/SS/PVB/FIT_RATIO",
-        shot_id=shot_id,
-    )
-    ss_emissivity = loader.get_radial_profile(
-        name="emissivity",
-        signal_name="ACT/CEL3/SS/PVB/C5291/EMISSIVITY",
-        shot_id=shot_id,
-    )
-    ss_velocity = loader.get_radial_profile(
-        name="velocity",
-        signal_name="ACT/CEL3/SS/PVB/C5291/VELOCITY",
-        shot_id=shot_id,
-    )
-    ss_temperature = loader.get_radial_profile(
-        name="temperature",
-        signal_name="ACT/CEL3/SS/PVB/C5291/TEMPERATURE",
-        shot_id=shot_id,
+    # All UDA requests for a shot are independent, so issue them concurrently
+    loop = asyncio.get_running_loop()
+    radial_requests = [
+        loop.run_in_executor(
+            uda_executor, loader.get_radial_profile, name, signal_name, shot_id
+        )
+        for name, signal_name in RADIAL_SIGNALS.items()
+    ]
+    volume_requests = [
+        loop.run_in_executor(
+            uda_executor, loader.get_volume_data, name, signal_name, shot_id
+        )
+        for name, signal_name in VOLUME_SIGNALS.items()
+    ]
+    try:
+        profiles = await asyncio.gather(*radial_requests, *volume_requests)
+    finally:
+        loader.release_wavelength(shot_id)
+    radial_profiles = profiles[: len(RADIAL_SIGNALS)]
+    wavelength_profiles = profiles[len(RADIAL_SIGNALS) :]
+
+    # Interpolation is CPU-bound, so run it off the event loop to keep it free to
+    # dispatch other shots' requests, on its own pool so it never queues behind them
+    return await loop.run_in_executor(
+        executor,
+        build_dataset,
+        shot_id,
+        radial_profiles,
+        wavelength_profiles,
+        sample_method,
+        num_samples,
     )
 
-    # Interpolate all profiles to common time base
+
+def build_dataset(
+    shot_id: int,
+    radial_profiles: list[xr.Dataset],
+    wavelength_profiles: list[xr.Dataset],
+    sample_method: str = "grid",
+    num_samples: int = 10,
+) -> xr.Dataset:
+    # Interpolate all profiles to common time base. The number of frames is fixed
+    # explicitly (421 for -0.1s to 2.0s at 5ms) because np.arange with a float step
+    # can gain or lose the end point, which would change the stored array shapes.
     min_time = -0.1
     max_time = 2.0
     dt = 0.005
 
-    time_base = np.arange(min_time, max_time + dt, dt)
-    radial_profiles = [ss_fit_ratio, ss_emissivity, ss_velocity, ss_temperature]
-    radial_profiles = [profile.interp(time=time_base) for profile in radial_profiles]
-    radial_profiles = xr.merge(radial_profiles, compat="identical")
+    num_times = round((max_time - min_time) / dt) + 1
+    time_base = np.linspace(min_time, max_time, num_times)
+    radial_profiles = interpolate_time(radial_profiles, time_base)
 
-    ## SS Fits
-    ss_fits = loader.get_volume_data(
-        name="ss_fits",
-        signal_name="ACT/CEL3/SS/PVB/SS_FITS",
-        shot_id=shot_id,
-    )
+    # Only a narrow band around the line is kept, so crop the spectra before
+    # interpolating rather than interpolating every wavelength and discarding most.
+    # All the spectra share one wavelength axis, so the slice is found once.
+    wavelength_range = (528, 531)
+    wavelength = wavelength_profiles[0].indexes["wavelength"]
+    wavelength_slice = wavelength.slice_indexer(*wavelength_range)
+    wavelength_profiles = [
+        profile.isel(wavelength=wavelength_slice) for profile in wavelength_profiles
+    ]
 
-    ss_counts = loader.get_volume_data(
-        name="ss_counts",
-        signal_name="ACT/CEL3/SS/COUNTS",
-        shot_id=shot_id,
-    )
-    ss_bg_counts = loader.get_volume_data(
-        name="ss_bg_counts",
-        signal_name="ACT/CEL3/SS/PVB/SCALED_BG_COUNTS",
-        shot_id=shot_id,
-    )
+    # Interpolate all wavelength profiles to common time base
+    wavelength_profiles = interpolate_time(wavelength_profiles, time_base)
 
-    ## Sub Fits
-    ss_sub_fits = loader.get_volume_data(
-        name="ss_sub_fits",
-        signal_name="ACT/CEL3/SS/PVB/SUB_FITS",
-        shot_id=shot_id,
-    )
-    ss_sub_counts = loader.get_volume_data(
-        name="ss_sub_counts",
-        signal_name="ACT/CEL3/SS/PVB/SUB_COUNTS",
-        shot_id=shot_id,
+    # Every profile now shares the same coordinates, so build the Datasets straight
+    # from their variables rather than paying for merge's alignment checks
+    radial_profiles = xr.Dataset(
+        {
+            name: var.variable
+            for profile in radial_profiles
+            for name, var in profile.data_vars.items()
+        },
+        coords=radial_profiles[0].coords,
     )
 
-    # Interpolate all wavelength profiles to common time base
-    wavelength_profiles = [ss_fits, ss_counts, ss_bg_counts, ss_sub_fits, ss_sub_counts]
-    wavelength_profiles = [
-        profile.interp(time=time_base) for profile in wavelength_profiles
-    ]
-    wavelength_profiles = xr.merge(wavelength_profiles, compat="identical")
-    wavelength_range = (528, 531)
-    wavelength_profiles = wavelength_profiles.sel(
-        wavelength=slice(wavelength_range[0], wavelength_range[1])
+    wavelength_profiles = xr.Dataset(
+        {
+            name: var.variable
+            for profile in wavelength_profiles
+            for name, var in profile.data_vars.items()
+        },
+        coords=wavelength_profiles[0].coords,
     )
 
     # # Subsample wavelength profiles in time
@@ -102,36 +239,145 @@ def load_dataset(
     #     wavelength_profiles, method=sample_method, num_samples=num_samples
     # )
 
-    dataset = xr.merge(
-        [
-            radial_profiles,
-            wavelength_profiles,
-        ],
-        compat="identical",
+    dataset = xr.Dataset(
+        {
+            name: var.variable
+            for profiles in (radial_profiles, wavelength_profiles)
+            for name, var in profiles.data_vars.items()
+        },
+        coords=wavelength_profiles.coords,
     )
 
+    # Record which frames have any temperature data so the UI doesn't have to scan
+    # the full temperature array to find them when it starts up
+    dataset["valid_time_mask"] = dataset.temperature_data.notnull().any("major_radius")
+
     dataset = dataset.expand_dims({"shot_id": [shot_id]})
     return dataset
 
 
-def write_dataset(dataset: xr.Dataset, shot_id: int, output_path: Path):
+def write_dataset(datasets: list[xr.Dataset], output_path: Path, batch_size: int = 1):
     output_file = output_path / "shots.zarr"
+    # Each shot brings its own radius and wavelength coords, which can differ in the
+    # last few digits between shots. Keep the first shot's, as a per-shot append
+    # would, rather than outer-joining them into a NaN-padded union.
+    dataset = xr.concat(datasets, dim="shot_id", join="override").sortby("shot_id")
+    shot_ids = dataset.shot_id.values.tolist()
     if output_file.exists():
         dataset.to_zarr(output_file, mode="a", append_dim="shot_id")
     else:
-        dataset.to_zarr(output_file)
-    logger.info(f"Saved dataset for shot {shot_id} to {output_file}")
+        # Chunk along shot_id to match the batch size so each append writes whole
+        # chunks, and keep the full time base in one chunk so a shot is never split
+        encoding = {
+            name: {"chunks": (batch_size, *var.shape[1:]), **COMPRESSION}
+            for name, var in dataset.data_vars.items()
+        }
+        for name, var in dataset.data_vars.items():
+            if var.dtype.kind == "f":
+                encoding[name]["dtype"] = "float32"
+        encoding["time"] = {"chunks": (dataset.sizes["time"],)}
+        dataset.to_zarr(output_file, encoding=encoding)
+    logger.info(f"Saved dataset for shots {shot_ids} to {output_file}")
 
 
-def process_shot(
-    shot_id: int, output_path: Path, sample_method: str = "grid", num_samples: int = 10
-):
+async def process_shot(
+    shot_id: int,
+    sample_method: str = "grid",
+    num_samples: int = 10,
+    loader: UDALoader | None = None,
+    uda_executor: Executor | None = None,
+    executor: Executor | None = None,
+) -> xr.Dataset | None:
     try:
         logger.info(f"Processing shot {shot_id}")
-        dataset = load_dataset(shot_id, sample_method, num_samples)
-        write_dataset(dataset, shot_id, output_path)
+        return await load_dataset(
+            shot_id,
+            sample_method,
+            num_samples,
+            loader=loader,
+            uda_executor=uda_executor,
+            executor=executor,
+        )
     except Exception as e:
         logger.error(f"Failed to process shot {shot_id}: {e}")
+        return None
+
+
+async def process_shots(
+    shot_ids: Iterable[int],
+    output_path: Path,
+    sample_method: str = "grid",
+    num_samples: int = 10,
+    loader: UDALoader | None = None,
+    max_concurrent_shots: int = 8,
+    batch_size: int = 10,
+    max_uda_connections: int = 8,
+):
+    semaphore = asyncio.Semaphore(max_concurrent_shots)
+    batch: list[xr.Dataset] = []
+    # Shots finish out of order, so each one waits for the shot before it to be
+    # batched and the store is always written in ascending shot order
+    shot_ids = sorted(set(shot_ids))
+    batched = [asyncio.Event() for _ in shot_ids]
+
+    async def flush():
+        datasets = batch.copy()
+        batch.clear()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                executor, write_dataset, datasets, output_path, batch_size
+            )
+            return
+        except Exception as e:
+            shots = [dataset.shot_id.item() for dataset in datasets]
+            if len(datasets) == 1:
+                logger.error(f"Failed to write shots {shots}: {e}")
+                return
+            logger.warning(f"Failed to write shots {shots} together: {e}")
+
+        # One bad shot (e.g. a different number of radii) fails the whole batch, so
+        # write the shots one at a time and only lose the ones that can't be stored
+        for dataset in datasets:
+            try:
+                await loop.run_in_executor(
+                    executor, write_dataset, [dataset], output_path, batch_size
+                )
+            except Exception as e:
+                logger.error(f"Failed to write shot {dataset.shot_id.item()}: {e}")
+
+    async def run(index: int):
+        # Keep the slot while waiting on earlier shots, so a stalled shot holds back
+        # new fetches rather than letting finished shots pile up in memory. Slots are
+        # handed out in shot order, so the earliest unbatched shot always has one.
+        async with semaphore:
+            try:
+                dataset = await process_shot(
+                    shot_ids[index],
+                    sample_method=sample_method,
+                    num_samples=num_samples,
+                    loader=loader,
+                    uda_executor=uda_executor,
+                    executor=executor,
+                )
+                if index > 0:
+                    await batched[index - 1].wait()
+                # Waiting on the previous shot also keeps appends from interleaving
+                if dataset is not None:
+                    batch.append(dataset)
+                    if len(batch) >= batch_size:
+                        await flush()
+            finally:
+                batched[index].set()
+
+    # Each UDA worker thread opens its own client, so the fetch pool is kept small
+    # and fixed to bound the number of connections. Interpolation and writes get a
+    # separate pool so they never hold up or wait behind fetches.
+    uda_executor = ThreadPoolExecutor(max_workers=max_uda_connections)
+    with uda_executor, ThreadPoolExecutor(max_concurrent_shots) as executor:
+        await asyncio.gather(*(run(index) for index in range(len(shot_ids))))
+        if batch:
+            await flush()
 
 
 def main():
@@ -156,22 +402,56 @@ def main():
     parser.add_argument(
         "--overwrite", action="store_true", help="Overwrite existing output file"
     )
-    parser.add_argument("--seed", type=int, default=42, help="Random seed for sampling")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=42,
+        help="Random seed for sampling (unused: time subsampling is disabled)",
+    )
+    parser.add_argument(
+        "--max-concurrent-shots",
+        type=int,
+        default=8,
+        help="Maximum number of shots to fetch from UDA concurrently",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=10,
+        help="Number of shots to accumulate before each write to the output dataset",
+    )
+    parser.add_argument(
+        "--max-uda-connections",
+        type=int,
+        default=8,
+        help="Maximum number of UDA clients to fetch signals with at once",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Directory to keep raw UDA signals in, so reruns skip fetching them",
+    )
     args = parser.parse_args()
 
-    np.random.seed(args.seed)
     shot_ids = range(args.shot_min, args.shot_max + 1)
 
     output_path = Path(args.output_path)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    for shot_id in shot_ids:
-        process_shot(
-            shot_id,
+    loader = get_loader(args.cache_dir)
+    asyncio.run(
+        process_shots(
+            shot_ids,
             output_path,
             sample_method=args.sample_method,
             num_samples=args.num_samples,
+            loader=loader,
+            max_concurrent_shots=args.max_concurrent_shots,
+            batch_size=args.batch_size,
+            max_uda_connections=args.max_uda_connections,
         )
+    )
 
 
 if __name__ == "__main__":
@@ -1,6 +1,11 @@
 import argparse
+import json
+import functools
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
-import pandas as pd
 import panel as pn
 import holoviews as hv
 import hvplot.xarray  # noqa: F401
@@ -85,75 +90,155 @@ class KeyboardShortcuts(ReactComponent):
     """
 
 
+# Sizing hvplot gives a line plot, for error bars drawn without their line
+HVPLOT_LINE_OPTIONS = dict(width=700)
+
+
+@dataclass(frozen=True, slots=True)
+class SignalArrays:
+    """One shot of values and errors, shaped ([signal,] time, radius[, wavelength])."""
+
+    data: np.ndarray
+    error: np.ndarray
+
+
+@dataclass(frozen=True, slots=True)
+class ResidualArrays(SignalArrays):
+    """The subtracted-spectrum residual, with its finite range per (time, radius)."""
+
+    ymin: np.ndarray
+    ymax: np.ndarray
+
+
+def has_errors(errors: np.ndarray) -> bool:
+    # Error bars are invisible when every error is NaN or zero, so skip building them
+    return bool(np.any(np.isfinite(errors) & (errors != 0)))
+
+
+def nan_minmax(values: np.ndarray) -> tuple[float, float]:
+    # Drop the NaNs once and reduce the compacted array, rather than having
+    # nanmin and nanmax each build their own masked copy
+    values = values.ravel()
+    finite = np.isfinite(values)
+    # Most slices have no gaps, in which case the buffer can be reduced as-is
+    if finite.all():
+        return values.min(), values.max()
+    values = values[finite]
+    if values.size == 0:
+        return np.nan, np.nan
+    return values.min(), values.max()
+
+
+def to_float32(values: np.ndarray) -> np.ndarray:
+    # Bokeh ships arrays to the browser as-is, so float32 halves the payload
+    return np.asarray(values, dtype=np.float32)
+
+
+def make_error_bars(
+    x: np.ndarray,
+    y: np.ndarray,
+    errors: np.ndarray,
+    x_name: str,
+    use_spread: bool = False,
+) -> hv.ErrorBars | hv.Spread:
+    # Pack the columns into one float32 buffer; each row is a contiguous view into it
+    columns = tuple(to_float32(np.stack([x, y, errors])))
+    dims = dict(kdims=[x_name], vdims=["data", "error"])
+    # Bokeh draws a segment per error bar, so a single band is cheaper to render
+    if use_spread:
+        return hv.Spread(columns, **dims).opts(fill_alpha=0.3, line_width=0)
+    return hv.ErrorBars(columns, **dims)
+
+
 def plot_profile_slice(
     name: str,
-    ds: xr.Dataset,
+    radius: np.ndarray,
+    values: np.ndarray,
+    errors: np.ndarray,
     time_point: float,
     radial_point: float,
     plot_options: dict,
     errors_only: bool = False,
+    use_spread: bool = False,
 ) -> None:
-    ds = ds.sel(time=time_point).copy()
-    ds = ds.rename({f"{name}_data": "data", f"{name}_error": "error"})
-
-    ymin, ymax = ds.data.values.min(), ds.data.values.max()
-    plot = ds.hvplot.line(
-        x="major_radius",
-        y="data",
+    ymin, ymax = nan_minmax(values)
+    axes = dict(
         title=f"{name} at t={time_point:.2f}s",
         ylim=(ymin * 0.8, ymax * 1.2),
         ylabel=name,
-    ).opts(**plot_options, line_alpha=0 if errors_only else 1)
+    )
 
-    error_bars = hv.ErrorBars(
-        (ds["major_radius"].values, ds["data"].values, ds["error"].values),
-    ).opts()
+    if errors_only and has_errors(errors):
+        # The line would be fully transparent, so send only the error bars and give
+        # them the axes and sizing hvplot would have put on the line
+        plot = make_error_bars(radius, values, errors, "major_radius", use_spread)
+        plot = plot.opts(**axes, **HVPLOT_LINE_OPTIONS, **plot_options)
+    else:
+        profile = xr.Dataset(
+            {"data": ("major_radius", values)}, {"major_radius": radius}
+        )
+        plot = profile.hvplot.line(x="major_radius", y="data", **axes).opts(
+            **plot_options, line_alpha=0 if errors_only else 1
+        )
+        if has_errors(errors):
+            plot = plot * make_error_bars(
+                radius, values, errors, "major_radius", use_spread
+            )
 
     radial_point_line = hv.VLine(radial_point).opts(
         color="red", line_width=2, line_dash="dashed"
     )
 
-    plot = plot * error_bars * radial_point_line
+    plot = plot * radial_point_line
     return plot
 
 
 def plot_volume(
     name: str,
-    ds: xr.Dataset,
+    wavelength: np.ndarray,
+    values: np.ndarray,
+    errors: np.ndarray,
     time_point: float,
     radial_point: float,
     plot_options: dict,
     no_padding: bool = False,
-    rename: bool = True,
     errors_only: bool = False,
     no_errors: bool = False,
     line_style: str = "solid",
+    use_spread: bool = False,
+    value_range: tuple[float, float] | None = None,
 ) -> None:
-    ds = ds.sel(time=time_point, major_radius=radial_point)
-    if rename:
-        ds = ds.rename({f"{name}_data": "data", f"{name}_error": "error"})
-
-    ymin, ymax = np.nanmin(ds.data.values), np.nanmax(ds.data.values)
+    ymin, ymax = nan_minmax(values) if value_range is None else value_range
 
     ylim = (ymin * 0.7, ymax * 1.3)
     if no_padding:
         ylim = (ymin, ymax)
 
-    plot = ds.hvplot.line(
-        x="wavelength",
-        y="data",
+    axes = dict(
         title=f"{name} at t={time_point:.2f}s and r={radial_point:.2f}m",
         ylim=ylim,
         ylabel=name,
-    ).opts(**plot_options, line_alpha=0 if errors_only else 1, line_dash=line_style)
+    )
+    show_errors = not no_errors and has_errors(errors)
 
-    error_bars = hv.ErrorBars(
-        (ds["wavelength"].values, ds["data"].values, ds["error"].values),
-    ).opts(**plot_options)
+    if errors_only and show_errors:
+        # The line would be fully transparent, so send only the error bars
+        error_bars = make_error_bars(
+            wavelength, values, errors, "wavelength", use_spread
+        )
+        return error_bars.opts(**axes, **HVPLOT_LINE_OPTIONS, **plot_options)
+
+    spectrum = xr.Dataset({"data": ("wavelength", values)}, {"wavelength": wavelength})
+    plot = spectrum.hvplot.line(x="wavelength", y="data", **axes).opts(
+        **plot_options, line_alpha=0 if errors_only else 1, line_dash=line_style
+    )
 
-    if no_errors:
+    if not show_errors:
         return plot
 
+    error_bars = make_error_bars(
+        wavelength, values, errors, "wavelength", use_spread
+    ).opts(**plot_options)
     plot = plot * error_bars
 
     return plot
@@ -164,40 +249,50 @@ def make_line_plots(
     ss_emissivity,
     ss_velocity,
     ss_temperature,
+    radius,
     time_point,
     radial_point,
     plot_options,
+    use_spread=False,
 ):
     fit_ratio_plot = plot_profile_slice(
         "fit_ratio",
-        ss_fit_ratio,
+        radius,
+        *ss_fit_ratio,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         errors_only=True,
     )
     emissivity_plot = plot_profile_slice(
         "emissivity",
-        ss_emissivity,
+        radius,
+        *ss_emissivity,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         errors_only=True,
     )
     velocity_plot = plot_profile_slice(
         "velocity",
-        ss_velocity,
+        radius,
+        *ss_velocity,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         errors_only=True,
     )
     temperature_plot = plot_profile_slice(
         "temperature",
-        ss_temperature,
+        radius,
+        *ss_temperature,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         errors_only=True,
     )
 
@@ -210,67 +305,104 @@ def make_line_plots(
     return left_column
 
 
+def make_residual(ss_sub_counts, ss_sub_fits):
+    # Both share the same coordinates, so subtract the raw arrays without alignment.
+    # The fit and count errors are independent, so they add in quadrature.
+    residual = ss_sub_counts.data - ss_sub_fits.data
+
+    # The residual plot's y-limits are the spectrum's own range, so reduce every
+    # spectrum in the shot now rather than one per click. NaNs are pushed to the
+    # opposite infinity so they never win, and all-NaN spectra come out as NaN.
+    finite = np.isfinite(residual)
+    ymin = np.where(finite, residual, np.inf).min(axis=-1)
+    ymax = np.where(finite, residual, -np.inf).max(axis=-1)
+    empty = ~finite.any(axis=-1)
+    ymin[empty] = ymax[empty] = np.nan
+
+    return ResidualArrays(
+        data=residual,
+        error=np.hypot(ss_sub_counts.error, ss_sub_fits.error),
+        ymin=ymin,
+        ymax=ymax,
+    )
+
+
 def make_volume_plots(
     ss_fits,
     ss_counts,
     ss_bg_counts,
     ss_sub_fits,
     ss_sub_counts,
+    ss_sub_residual,
+    wavelength,
     time_point,
     radial_point,
     plot_options,
+    use_spread=False,
+    residual_range=None,
 ):
     ss_fits_plot = plot_volume(
-        "ss_fits", ss_fits, time_point, radial_point, plot_options, no_errors=True
+        "ss_fits",
+        wavelength,
+        *ss_fits,
+        time_point,
+        radial_point,
+        plot_options,
+        use_spread=use_spread,
+        no_errors=True,
     )
     ss_counts_plot = plot_volume(
         "ss_counts",
-        ss_counts,
+        wavelength,
+        *ss_counts,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         errors_only=True,
     )
     ss_bg_counts_plot = plot_volume(
         "ss_bg_counts",
-        ss_bg_counts,
+        wavelength,
+        *ss_bg_counts,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         line_style="dashed",
         no_errors=True,
     )
 
     ss_sub_fits_plot = plot_volume(
         "ss_sub_fits",
-        ss_sub_fits,
+        wavelength,
+        *ss_sub_fits,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
     )
     ss_sub_counts_plot = plot_volume(
         "ss_sub_counts",
-        ss_sub_counts,
+        wavelength,
+        *ss_sub_counts,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         errors_only=True,
     )
 
-    ss_sub_residual = ss_sub_counts.copy().rename(
-        {"ss_sub_counts_data": "data", "ss_sub_counts_error": "error"}
-    ) - ss_sub_fits.copy().rename(
-        {"ss_sub_fits_data": "data", "ss_sub_fits_error": "error"}
-    )
-
     ss_sub_residual_plot = plot_volume(
         "residual",
-        ss_sub_residual,
+        wavelength,
+        *ss_sub_residual,
         time_point,
         radial_point,
         plot_options,
+        use_spread=use_spread,
         no_padding=True,
-        rename=False,
+        value_range=residual_range,
         errors_only=True,
     )
     zero_line = hv.HLine(0).opts(color="black", line_width=2, line_dash="solid")
@@ -286,45 +418,132 @@ def make_volume_plots(
     return right_column
 
 
+def _mix(value: int) -> int:
+    # splitmix64 finaliser
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+
+def feistel_permute(index: int, size: int, keys: list[int]) -> int:
+    """
+    Return the element at `index` of a pseudo-random permutation of `range(size)`.
+
+    A balanced Feistel network is a bijection on the smallest even-bit-width domain
+    covering `size`; cycle-walking (re-applying it until the result is in range)
+    restricts that bijection to `range(size)`. Needs O(1) memory regardless of size.
+    """
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    value = index
+    while True:
+        left, right = value >> half_bits, value & mask
+        for key in keys:
+            left, right = right, left ^ (_mix(right ^ key) & mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+MAX_SHUFFLED_FRAMES = 1_000_000
+
+CATEGORICAL_OPTIONS = ["1 - Bad", "2 - Average", "3 - Good"]
+DEFAULT_LABEL = CATEGORICAL_OPTIONS[0]
+
+RATINGS_PATH = "cxrs_validation_ratings.jsonl"
+SHOT_CACHE_SIZE = 8
+
+PROFILE_NAMES = ["fit_ratio", "emissivity", "velocity", "temperature"]
+VOLUME_NAMES = ["ss_fits", "ss_counts", "ss_bg_counts", "ss_sub_fits", "ss_sub_counts"]
+PLOT_VARIABLES = [
+    f"{name}_{kind}"
+    for name in PROFILE_NAMES + VOLUME_NAMES
+    for kind in ("data", "error")
+]
+
+
 class CXRSValidationApp:
-    def __init__(self, path):
-        self.dataset = xr.open_zarr(path)
-        valid_times = self.dataset.temperature_data.dropna(dim="time", how="all").time
-        self.dataset = self.dataset.sel(time=valid_times)
-
-        # Find regions of time where we kept wavelength profile data
-        subsampled_frames = self.dataset.stack(
-            frame=("shot_id", "time", "major_radius")
-        )
-        self.frames = subsampled_frames.frame
+    def __init__(
+        self,
+        path,
+        seed: int | None = None,
+        preload: bool = False,
+        use_spread: bool = False,
+    ):
+        # Open without dask so each frame only reads the Zarr chunks it touches.
+        # Time is stored as plain seconds, so there is nothing to decode.
+        self.dataset = xr.open_zarr(path, chunks=None, decode_times=False)
+        # Stores written before the sampler ordered its appends may be unsorted
+        if not self.dataset.indexes["shot_id"].is_monotonic_increasing:
+            self.dataset = self.dataset.sortby("shot_id")
+
+        # Frames are every radius at each (shot, time) with temperature data. The
+        # sampler stores that mask at write time; older datasets compute it here.
+        if "valid_time_mask" in self.dataset:
+            valid_time_mask = self.dataset.valid_time_mask.values
+        else:
+            valid_time_mask = (
+                self.dataset.temperature_data.notnull().any("major_radius").values
+            )
+        self.valid_times = np.flatnonzero(valid_time_mask)
+
+        self.shot_ids = self.dataset.shot_id.values
+        self.times = self.dataset.time.values
+        self.radii = self.dataset.major_radius.values
+        self.wavelengths = self.dataset.wavelength.values
+
+        # Only the plotted variables are needed from here on. Reading them all into
+        # memory up front makes every shot a cache hit, but the volume signals are
+        # large, so this is left to the caller for datasets that fit in RAM.
+        self.dataset = self.dataset[PLOT_VARIABLES]
+        if preload:
+            self.dataset = self.dataset.load()
+
+        # Randomize and choose a frame to show. Large datasets use a lazily evaluated
+        # permutation rather than materialising a shuffled index for every frame.
+        rng = np.random.default_rng(seed)
+        self.num_frames = len(self.valid_times) * len(self.radii)
+        if self.num_frames <= MAX_SHUFFLED_FRAMES:
+            self.frame_indices = rng.permutation(self.num_frames)
+        else:
+            self.frame_indices = None
+            self._permutation_keys = rng.integers(0, 2**32, size=4).tolist()
+
+        # Plots usually revisit the same handful of shots, so keep recent ones in
+        # memory. The prefetch thread fills this too, hence the lock.
+        self._shot_cache: OrderedDict[int, Future] = OrderedDict()
+        self._shot_cache_lock = threading.Lock()
+        # Going back and forth between frames reuses the plots already built for them
+        self._frame_plots = functools.lru_cache(maxsize=32)(self._make_frame_plots)
+
+        # Plotting options, shared by every frame
+        plot_options = dict(fontsize={"ylabel": 10, "xlabel": 10}, height=250)
+        self._line_plot_options = {**plot_options, "height": 210}
+        self._volume_plot_options = {**plot_options, "height": 280}
+        self.use_spread = use_spread
 
-        # Randomize and choose a frame to show
-        self.frame_indices = np.arange(len(self.frames))
-        np.random.shuffle(self.frame_indices)
+        # Load neighbouring frames' shots in the background while the user labels
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=1)
+
+        self._build_controls()
 
         self.current_index = 0
         self._get_frame(self.current_index)
         self.ratings = []
 
-    def _get_frame(self, index: int):
-        self.frame = self.frames.isel(frame=self.frame_indices[index])
-        self.shot_id = self.frame.shot_id.item()
-        self.time_point = self.frame.time.item()
-        self.radial_point = self.frame.major_radius.item()
-
-    def plot(self):
-        # Plotting options
-
-        logger.info(f"Starting app for shot {self.shot_id} at time {self.time_point}s")
+        # Ratings are appended as one JSON line per click, so a restarted session
+        # carries on the same log. Convert it with `python -m src.ratings`.
+        self._ratings_file = open(RATINGS_PATH, "a", buffering=1)
 
-        title = pn.pane.Markdown(
+    def _build_controls(self):
+        # The sidebar widgets never change, so build them once with the app
+        self._title = pn.pane.Markdown(
             """
             ## Controls
             """
         )
 
-        categorical_options = ["1 - Bad", "2 - Average", "3 - Good"]
-        emissivity_title = pn.pane.Markdown(
+        self._emissivity_title = pn.pane.Markdown(
             """
             ### Emissivity Quality Label
             """
@@ -332,11 +551,11 @@ class CXRSValidationApp:
 
         self.emissivity_label = pn.widgets.RadioBoxGroup(
             name="Emissivity Quality",
-            options=categorical_options,
+            options=CATEGORICAL_OPTIONS,
             inline=False,
         )
 
-        velocity_title = pn.pane.Markdown(
+        self._velocity_title = pn.pane.Markdown(
             """
             ### Velocity Quality Label
             """
@@ -344,11 +563,11 @@ class CXRSValidationApp:
 
         self.velocity_label = pn.widgets.RadioBoxGroup(
             name="Velocity Quality",
-            options=categorical_options,
+            options=CATEGORICAL_OPTIONS,
             inline=False,
         )
 
-        temperature_title = pn.pane.Markdown(
+        self._temperature_title = pn.pane.Markdown(
             """
             ### Temperature Quality Label
             """
@@ -356,7 +575,7 @@ class CXRSValidationApp:
 
         self.temperature_label = pn.widgets.RadioBoxGroup(
             name="Temperature Quality",
-            options=categorical_options,
+            options=CATEGORICAL_OPTIONS,
             inline=False,
         )
 
@@ -365,23 +584,116 @@ class CXRSValidationApp:
             self.velocity_label,
             self.temperature_label,
         ]
+
+    def _shot_slice(self, shot_id: int) -> dict[str, SignalArrays]:
+        # The cache holds futures so that a shot being loaded by the prefetch thread
+        # is waited on rather than read twice, without blocking loads of other shots
+        with self._shot_cache_lock:
+            future = self._shot_cache.get(shot_id)
+            is_owner = future is None
+            if is_owner:
+                future = self._shot_cache[shot_id] = Future()
+                if len(self._shot_cache) > SHOT_CACHE_SIZE:
+                    self._shot_cache.popitem(last=False)
+            else:
+                self._shot_cache.move_to_end(shot_id)
+
+        if is_owner:
+            try:
+                future.set_result(self._load_shot_slice(shot_id))
+            except Exception as error:
+                with self._shot_cache_lock:
+                    self._shot_cache.pop(shot_id, None)
+                future.set_exception(error)
+        return future.result()
+
+    def _load_shot_slice(self, shot_id: int) -> dict[str, SignalArrays]:
+        # Read every variable for the shot in one go and keep the bare (data, error)
+        # arrays, laid out (time, radius[, wavelength]) so frames are plain indexing
+        shot = self.dataset.sel(shot_id=shot_id)
+        shot = shot.transpose("time", "major_radius", ...).load()
+        # Older stores hold float64; plots only need float32
+        slabs = {
+            name: SignalArrays(
+                data=to_float32(shot[f"{name}_data"].values),
+                error=to_float32(shot[f"{name}_error"].values),
+            )
+            for name in VOLUME_NAMES
+        }
+        # The radial profiles all share (time, radius), so stack them in
+        # PROFILE_NAMES order and one index fetches every profile for a frame
+        slabs["profiles"] = SignalArrays(
+            data=to_float32(
+                np.stack([shot[f"{n}_data"].values for n in PROFILE_NAMES])
+            ),
+            error=to_float32(
+                np.stack([shot[f"{n}_error"].values for n in PROFILE_NAMES])
+            ),
+        )
+        # The residual only depends on the shot, so build it once here
+        slabs["residual"] = make_residual(slabs["ss_sub_counts"], slabs["ss_sub_fits"])
+        return slabs
+
+    def _perm_get(self, index: int) -> int:
+        if self.frame_indices is not None:
+            return self.frame_indices[index]
+        return feistel_permute(
+            index % self.num_frames, self.num_frames, self._permutation_keys
+        )
+
+    def _prefetch_neighbours(self):
+        # Either button may be pressed next, so warm the shots on both sides
+        for index in (self.current_index + 1, self.current_index - 1):
+            if not 0 <= index < self.num_frames:
+                continue
+            shot_index, _, _ = self._frame_location(self._perm_get(index))
+            self._prefetch_pool.submit(
+                self._shot_slice, self.shot_ids[shot_index].item()
+            )
+
+    def _frame_location(self, frame: int) -> tuple[int, int, int]:
+        # Map a flat frame number to (shot, time, radius) indices into the coords
+        valid_time, radius_index = divmod(frame, len(self.radii))
+        shot_index, time_index = np.unravel_index(
+            self.valid_times[valid_time], (len(self.shot_ids), len(self.times))
+        )
+        return shot_index, time_index, radius_index
+
+    def _get_frame(self, index: int):
+        self.frame = tuple(int(i) for i in self._frame_location(self._perm_get(index)))
+        self.shot_index, time_index, radius_index = self.frame
+        self.shot_id = self.shot_ids[self.shot_index].item()
+        self.time_point = self.times[time_index].item()
+        self.radial_point = self.radii[radius_index].item()
+
+    def plot(self):
+        # Plotting options
+
+        logger.info(f"Starting app for shot {self.shot_id} at time {self.time_point}s")
+
         pn.state.cache.setdefault("focus_index", 0)
 
+        def reset_labels():
+            # Hold the document so the three resets go to the browser as one update
+            with pn.io.hold():
+                for group in self.groups:
+                    group.value = DEFAULT_LABEL
+
         def handle_next_click(event):
-            for group in self.groups:
-                group.value = categorical_options[0]
+            reset_labels()
             self.save_state()
             self.current_index += 1
             self._get_frame(self.current_index)
-            self.contents[:] = self.replot_data()
+            self.update_plots()
+            self._prefetch_neighbours()
 
         def handle_prev_click(event):
-            for group in self.groups:
-                group.value = categorical_options[0]
+            reset_labels()
             self.save_state()
             self.current_index -= 1
             self._get_frame(self.current_index)
-            self.contents[:] = self.replot_data()
+            self.update_plots()
+            self._prefetch_neighbours()
 
         next_button = pn.widgets.Button(name="Next", button_type="primary")
         next_button.on_click(handle_next_click)
@@ -392,9 +704,9 @@ class CXRSValidationApp:
         navigation = pn.Row(prev_button, next_button)
 
         shortcuts = [
-            KeyboardShortcut(name=categorical_options[0], key="1"),
-            KeyboardShortcut(name=categorical_options[1], key="2"),
-            KeyboardShortcut(name=categorical_options[2], key="3"),
+            KeyboardShortcut(name=CATEGORICAL_OPTIONS[0], key="1"),
+            KeyboardShortcut(name=CATEGORICAL_OPTIONS[1], key="2"),
+            KeyboardShortcut(name=CATEGORICAL_OPTIONS[2], key="3"),
             KeyboardShortcut(name="enter", key="Enter"),
             KeyboardShortcut(name="leftarrow", key="ArrowLeft"),
             KeyboardShortcut(name="rightarrow", key="ArrowRight"),
@@ -426,19 +738,23 @@ class CXRSValidationApp:
         shortcuts_component.on_msg(handle_shortcut)
 
         sidebar = pn.Column(
-            title,
+            self._title,
             navigation,
-            emissivity_title,
+            self._emissivity_title,
             self.emissivity_label,
-            velocity_title,
+            self._velocity_title,
             self.velocity_label,
-            temperature_title,
+            self._temperature_title,
             self.temperature_label,
             shortcuts_component,
         )
 
+        # Navigation swaps the objects in these panes, so the layout around them is
+        # built once and Bokeh only has to patch the figures
         left, right = self.replot_data()
-        self.contents = pn.Row(left, right)
+        self._left_pane = pn.pane.HoloViews(left)
+        self._right_pane = pn.pane.HoloViews(right)
+        self.contents = pn.Row(self._left_pane, self._right_pane)
 
         self.app = pn.template.MaterialTemplate(
             title="CXRS Validation UI",
@@ -448,57 +764,56 @@ class CXRSValidationApp:
         )
 
         self.app.servable()
+        pn.state.on_session_destroyed(lambda session_context: self.close())
+        self._prefetch_neighbours()
 
     def replot_data(self):
-        plot_options = dict(fontsize={"ylabel": 10, "xlabel": 10}, height=250)
-
-        line_plot_options = plot_options.copy()
-        line_plot_options.update(dict(height=210))
-
-        volume_plot_options = plot_options.copy()
-        volume_plot_options.update(dict(height=280))
-
-        # Load data for the selected frame
-
-        # Load radial profile data for the shot
-        radial_profiles = self.dataset.sel(shot_id=self.shot_id)
-        ss_fit_ratio = radial_profiles[["fit_ratio_data", "fit_ratio_error"]]
-        ss_emissivity = radial_profiles[["emissivity_data", "emissivity_error"]]
-        ss_velocity = radial_profiles[["velocity_data", "velocity_error"]]
-        ss_temperature = radial_profiles[["temperature_data", "temperature_error"]]
-
-        # Load wavelength profile data for the shot
-        wavelength_profiles = self.dataset.sel(shot_id=self.shot_id)
-        ss_fits = wavelength_profiles[["ss_fits_data", "ss_fits_error"]]
-        ss_counts = wavelength_profiles[["ss_counts_data", "ss_counts_error"]]
-        ss_bg_counts = wavelength_profiles[["ss_bg_counts_data", "ss_bg_counts_error"]]
-
-        ss_sub_fits = wavelength_profiles[["ss_sub_fits_data", "ss_sub_fits_error"]]
-        ss_sub_counts = wavelength_profiles[
-            ["ss_sub_counts_data", "ss_sub_counts_error"]
-        ]
+        self.left_column, self.right_column = self._frame_plots(*self.frame)
+        return self.left_column, self.right_column
 
-        self.left_column = make_line_plots(
-            ss_fit_ratio,
-            ss_emissivity,
-            ss_velocity,
-            ss_temperature,
-            self.time_point,
-            self.radial_point,
-            plot_options=line_plot_options,
+    def update_plots(self):
+        self._left_pane.object, self._right_pane.object = self.replot_data()
+
+    def _make_frame_plots(self, shot_index: int, time_index: int, radius_index: int):
+        # Frames are addressed by their integer positions, so the cached arrays are
+        # indexed directly without any coordinate lookup
+        shot = self._shot_slice(self.shot_ids[shot_index].item())
+        time_point = self.times[time_index].item()
+        radial_point = self.radii[radius_index].item()
+
+        def spectrum(name):
+            index = (time_index, radius_index)
+            return shot[name].data[index], shot[name].error[index]
+
+        profiles = shot["profiles"]
+        left_column = make_line_plots(
+            *zip(profiles.data[:, time_index], profiles.error[:, time_index]),
+            self.radii,
+            time_point,
+            radial_point,
+            plot_options=self._line_plot_options,
+            use_spread=self.use_spread,
         )
 
-        self.right_column = make_volume_plots(
-            ss_fits,
-            ss_counts,
-            ss_bg_counts,
-            ss_sub_fits,
-            ss_sub_counts,
-            self.time_point,
-            self.radial_point,
-            plot_options=volume_plot_options,
+        residual = shot["residual"]
+        right_column = make_volume_plots(
+            spectrum("ss_fits"),
+            spectrum("ss_counts"),
+            spectrum("ss_bg_counts"),
+            spectrum("ss_sub_fits"),
+            spectrum("ss_sub_counts"),
+            spectrum("residual"),
+            self.wavelengths,
+            time_point,
+            radial_point,
+            plot_options=self._volume_plot_options,
+            use_spread=self.use_spread,
+            residual_range=(
+                residual.ymin[time_index, radius_index],
+                residual.ymax[time_index, radius_index],
+            ),
         )
-        return self.left_column, self.right_column
+        return left_column, right_column
 
     def save_state(self):
         logger.info(
@@ -518,20 +833,39 @@ class CXRSValidationApp:
 
         logger.info(f"Current labels: {info}")
 
-        pd.DataFrame(self.ratings).to_csv("cxrs_validation_ratings.csv", index=False)
+        # Append just this row rather than rewriting every previous rating
+        self._ratings_file.write(json.dumps(info) + "\n")
+        self._ratings_file.flush()
+
+    def close(self):
+        self._prefetch_pool.shutdown(wait=False)
+        self._ratings_file.close()
 
 
 def main():
     parser = argparse.ArgumentParser(description="CXRS Validation UI")
     parser.add_argument("path", type=str, help="Path to CXRS frame file data")
     parser.add_argument("--seed", type=int, default=50, help="Random seed for sampling")
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Read all plotted variables into memory at startup",
+    )
+    parser.add_argument(
+        "--use-spread",
+        action="store_true",
+        help="Draw errors as a shaded band instead of error bars",
+    )
 
     args = parser.parse_args()
 
-    np.random.seed(args.seed)
-
-    app = CXRSValidationApp(args.path)
+    app = CXRSValidationApp(
+        args.path, seed=args.seed, preload=args.preload, use_spread=args.use_spread
+    )
     app.plot()
 
 
-main()
+# `panel serve` runs this file as a module named bokeh_app_<uuid>, so guard on
+# that as well as plain script execution; importing the module no longer starts the UI
+if __name__ == "__main__" or __name__.startswith("bokeh"):
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import csv
+import json
+from pathlib import Path
+
+
+def jsonl_to_csv(jsonl_path: Path, csv_path: Path):
+    """Convert the UI's JSON-lines rating log into a CSV file.
+
+    Columns are taken from every record in the order they first appear, so logs
+    written before a label was added still convert (missing values are left blank).
+    """
+    with open(jsonl_path) as f:
+        ratings = [json.loads(line) for line in f if line.strip()]
+
+    fieldnames = list(dict.fromkeys(key for rating in ratings for key in rating))
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(ratings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert CXRS ratings to CSV")
+    parser.add_argument("input", type=Path, help="Path to the JSON-lines rating log")
+    parser.add_argument("output", type=Path, help="Path to write the CSV to")
+    args = parser.parse_args()
+
+    jsonl_to_csv(args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import numpy as np
+import xarray as xr
+
+from src.frame_sampler import interpolate_time, process_shots
+
+
+TIME_BASE = np.linspace(-0.1, 2.0, 421)
+
+
+def make_profile(
+    name: str, time: np.ndarray, shape: tuple[int, ...], seed: int
+) -> xr.Dataset:
+    rng = np.random.default_rng(seed)
+    dims = ("time", "major_radius", "wavelength")[: len(shape) + 1]
+    coords = {"time": time, "major_radius": np.linspace(1.0, 1.5, shape[0])}
+    if len(shape) > 1:
+        coords["wavelength"] = np.linspace(528, 531, shape[1])
+
+    variables = {}
+    for kind in ("data", "error"):
+        values = rng.normal(size=(len(time), *shape)).astype(np.float32)
+        values[:10] = np.nan  # leading frames with no data
+        values[-7:] = np.nan  # trailing frames with no data
+        values[50:53] = np.nan  # interior gap
+        values[80, 1] = np.nan  # a single missing point
+        variables[f"{name}_{kind}"] = (dims, values)
+    return xr.Dataset(variables, coords=coords)
+
+
+def test_interpolate_time_matches_xarray_interp():
+    # Two radial profiles share a time axis and a volume profile has its own. Both
+    # axes start after and end before the time base, so points outside are covered.
+    radial_time = np.arange(0.0012, 1.5, 0.0037)
+    volume_time = np.arange(-0.05, 1.9, 0.0043)
+    profiles = [
+        make_profile("emissivity", radial_time, (5,), seed=0),
+        make_profile("velocity", radial_time, (5,), seed=1),
+        make_profile("ss_counts", volume_time, (4, 6), seed=2),
+    ]
+    originals = [profile.copy(deep=True) for profile in profiles]
+
+    result = interpolate_time(profiles, TIME_BASE)
+
+    for profile, original, interpolated in zip(profiles, originals, result):
+        expected = original.interp(time=TIME_BASE)
+        np.testing.assert_array_equal(interpolated.time.values, TIME_BASE)
+        for name, var in expected.data_vars.items():
+            assert interpolated[name].dims == var.dims
+            np.testing.assert_allclose(
+                interpolated[name].values, var.values, rtol=1e-5, atol=1e-6
+            )
+        # The source arrays are left untouched
+        xr.testing.assert_identical(profile, original)
+
+
+class StubLoader:
+    """Stands in for UDALoader, returning small synthetic signals for each shot."""
+
+    def __init__(self, failing_shots=(), radii=None):
+        self.failing_shots = set(failing_shots)
+        self.radii = radii or {}
+
+    def _profile(self, name, shot_id, wavelength=None):
+        if shot_id in self.failing_shots:
+            raise RuntimeError(f"No data for shot {shot_id}")
+        # Later shots return sooner, so shots finish in the reverse of their order
+        time.sleep(0.01 * (110 - shot_id))
+        coords = {
+            "time": np.linspace(0.0, 1.0, 50),
+            "major_radius": np.linspace(1.0, 1.5, self.radii.get(shot_id, 12)),
+        }
+        shape = (50, len(coords["major_radius"]))
+        if wavelength is not None:
+            coords["wavelength"] = wavelength
+            shape = (*shape, len(wavelength))
+        dims = tuple(coords)
+        values = np.full(shape, shot_id, dtype=np.float32)
+        return xr.Dataset(
+            {f"{name}_data": (dims, values), f"{name}_error": (dims, values)},
+            coords=coords,
+        )
+
+    def get_radial_profile(self, name, signal_name, shot_id):
+        return self._profile(name, shot_id)
+
+    def get_volume_data(self, name, signal_name, shot_id):
+        return self._profile(name, shot_id, wavelength=np.linspace(527, 532, 20))
+
+    def release_wavelength(self, shot_id):
+        pass
+
+
+def test_process_shots_writes_every_storable_shot_in_order(tmp_path):
+    # Shot 103 fails to fetch and shot 105 has a radius more than the rest of its
+    # batch; only those two are lost
+    loader = StubLoader(failing_shots=[103], radii={105: 13})
+
+    asyncio.run(
+        process_shots(
+            range(100, 108),
+            tmp_path,
+            loader=loader,
+            max_concurrent_shots=4,
+            batch_size=4,
+        )
+    )
+
+    store = xr.open_zarr(tmp_path / "shots.zarr")
+    np.testing.assert_array_equal(store.shot_id.values, [100, 101, 102, 104, 106, 107])
+    assert store.sizes["major_radius"] == 12
+    # Each shot's values follow its shot_id, so rows weren't shuffled between shots
+    temperature = store.temperature_data.isel(time=100, major_radius=0).values
+    np.testing.assert_array_equal(temperature, store.shot_id.values)
@@ -0,0 +1,18 @@
+import pytest
+
+from src.main import feistel_permute
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 100, 1000, 1023, 1024, 1025, 4099])
+def test_feistel_permute_is_a_bijection(size):
+    keys = [12345, 67890, 13579, 24680]
+    permuted = [feistel_permute(index, size, keys) for index in range(size)]
+    assert sorted(permuted) == list(range(size))
+
+
+def test_feistel_permute_depends_on_keys():
+    size = 1000
+    first = [feistel_permute(index, size, [1, 2, 3, 4]) for index in range(size)]
+    second = [feistel_permute(index, size, [5, 6, 7, 8]) for index in range(size)]
+    assert first != second
+    assert first != list(range(size))